@@ -16,12 +16,10 @@ from typing import Any, Optional, Sequence
 
 from sacad import colored_logging, sources
 from sacad.cover import (
-    HAS_JPEGOPTIM,
-    HAS_OPTIPNG,
-    HAS_OXIPNG,
     SUPPORTED_IMG_FORMATS,
     CoverImageFormat,
     CoverSourceResult,
+    has_program,
 )
 from sacad.sources.base import CoverSource
 
@@ -201,9 +199,9 @@ def cl_main() -> None:
         logging.getLogger("asyncio").setLevel(logging.CRITICAL + 1)
 
     # display warning if optipng/oxipng or jpegoptim are missing
-    if not HAS_JPEGOPTIM:
+    if not has_program("jpegoptim"):
         logging.getLogger("Main").warning("jpegoptim could not be found, JPEG crunching will be disabled")
-    if not (HAS_OPTIPNG or HAS_OXIPNG):
+    if not (has_program("optipng") or has_program("oxipng")):
         logging.getLogger("Main").warning("optipng or oxipng could not be found, PNG crunching will be disabled")
 
     # search and download
@@ -1,7 +1,9 @@
 """Sacad album cover."""
 
 import asyncio
+import contextlib
 import enum
+import functools
 import io
 import itertools
 import logging
@@ -9,8 +11,9 @@ import math
 import mimetypes
 import operator
 import os
-import pickle
 import shutil
+import sqlite3
+import struct
 import urllib.parse
 from typing import Dict
 
@@ -27,7 +30,7 @@ import PIL.ImageFile
 import PIL.ImageFilter
 import web_cache
 
-from sacad import mkstemp_ctx
+from sacad import mem_cache, mkstemp_ctx
 
 PIL.ImageFile.LOAD_TRUNCATED_IMAGES = True
 
@@ -68,12 +71,17 @@ class CoverImageMetadata(enum.IntFlag):
     ALL = 3
 
 
-HAS_JPEGOPTIM = shutil.which("jpegoptim") is not None
-HAS_OPTIPNG = shutil.which("optipng") is not None
-HAS_OXIPNG = shutil.which("oxipng") is not None
 SUPPORTED_IMG_FORMATS = {"jpg": CoverImageFormat.JPEG, "jpeg": CoverImageFormat.JPEG, "png": CoverImageFormat.PNG}
 FORMAT_EXTENSIONS = {CoverImageFormat.JPEG: "jpg", CoverImageFormat.PNG: "png"}
 
+logger = logging.getLogger("Cover")
+
+
+@functools.lru_cache(maxsize=None)
+def has_program(name):
+    """Return True if program is available in PATH, False otherwise, only looking it up on first call."""
+    return shutil.which(name) is not None
+
 
 def is_square(x):
     """Return True if integer x is a perfect square, False otherwise."""
@@ -86,6 +94,8 @@ class CoverSourceResult:
     METADATA_PEEK_SIZE_INCREMENT = 2**12
     MAX_FILE_METADATA_PEEK_SIZE = 20 * METADATA_PEEK_SIZE_INCREMENT
     IMG_SIG_SIZE = 16
+    # metadata cache entry: format enum value, width, height (0 if unknown)
+    METADATA_CACHE_STRUCT = struct.Struct("<BII")
 
     def __init__(
         self,
@@ -135,20 +145,29 @@ class CoverSourceResult:
                 appdirs.user_cache_dir(appname="sacad", appauthor=False), "sacad-cache.sqlite"
             )
             os.makedirs(os.path.dirname(cache_filepath), exist_ok=True)
-            __class__.image_cache = web_cache.WebCache(
-                cache_filepath,
-                "cover_image_data",
-                caching_strategy=web_cache.CachingStrategy.LRU,
-                expiration=60 * 60 * 24 * 365,
-            )  # 1 year
-            __class__.metadata_cache = web_cache.WebCache(
-                cache_filepath,
-                "cover_metadata",
-                caching_strategy=web_cache.CachingStrategy.LRU,
-                expiration=60 * 60 * 24 * 365,
-            )  # 1 year
+            # keep recently used entries in memory, the same thumbnails are often requested several times in a run,
+            # bound the memory used because full size images can be very large
+            __class__.image_cache = mem_cache.LruMemoryCache(
+                web_cache.WebCache(
+                    cache_filepath,
+                    "cover_image_data",
+                    caching_strategy=web_cache.CachingStrategy.LRU,
+                    expiration=60 * 60 * 24 * 365,
+                ),  # 1 year
+                64,
+                max_bytes=4 * 1024 * 1024,
+            )
+            __class__.metadata_cache = mem_cache.LruMemoryCache(
+                web_cache.WebCache(
+                    cache_filepath,
+                    "cover_metadata_v2",
+                    caching_strategy=web_cache.CachingStrategy.LRU,
+                    expiration=60 * 60 * 24 * 365,
+                ),  # 1 year
+                4096,
+            )
             for cache, cache_name in zip(
-                (__class__.image_cache, __class__.metadata_cache), ("cover_image_data", "cover_metadata")
+                (__class__.image_cache, __class__.metadata_cache), ("cover_image_data", "cover_metadata_v2")
             ):
                 purged_count = cache.purge()
                 logging.getLogger("Cache").debug(
@@ -156,6 +175,15 @@ class CoverSourceResult:
                 )
                 row_count = len(cache)
                 logging.getLogger("Cache").debug(f"Cache {cache_name!r} contains {row_count} entries")
+            if not web_cache.DISABLE_PERSISTENT_CACHING:
+                with contextlib.closing(sqlite3.connect(cache_filepath)) as db_connection:
+                    # drop the tables of the previous metadata cache format, they are not used anymore
+                    with db_connection:
+                        for legacy_table_name in (
+                            f"cover_metadata_f{web_cache.DB_FORMAT_VERSION}",
+                            f"cover_metadata_post_f{web_cache.DB_FORMAT_VERSION}",
+                        ):
+                            db_connection.execute(f"DROP TABLE IF EXISTS {legacy_table_name};")
 
     def __str__(self):
         s = f"{self.__class__.__name__} {self.urls[0]!r}"
@@ -177,7 +205,7 @@ class CoverSourceResult:
         images_data = []
         for i, url in enumerate(self.urls):
             # download
-            logging.getLogger("Cover").info(f"Downloading cover {url!r} (part {i + 1}/{len(self.urls)})...")
+            logger.info("Downloading cover %r (part %u/%u)...", url, i + 1, len(self.urls))
             headers: Dict[str, str] = {}
             self.source.updateHttpHeaders(headers)
 
@@ -208,13 +236,30 @@ class CoverSourceResult:
             __class__.isProgressiveJpegData(images_data[0]) and convert_progressive_jpeg  # type: ignore
         )
         if need_post_process:
-            # post process
-            image_data = self.postProcess(
-                images_data, target_format if need_format_change else None, target_size if need_size_change else None
+            # post process, in a thread to avoid blocking the event loop, PIL releases the GIL for heavy work
+            # let PIL optimize the encoding only if the data can not be crunched afterwards, it would be redundant
+            out_format = target_format if need_format_change else self.format
+            post_process = functools.partial(
+                self.postProcess,
+                images_data,
+                target_format if need_format_change else None,
+                target_size if need_size_change else None,
+            )
+            crunch_available = __class__.canCrunch(out_format)
+            image_data = await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(post_process, optimize=not crunch_available)
             )
 
             # crunch image again
-            image_data = await __class__.crunch(image_data, target_format)  # type: ignore
+            if crunch_available:
+                crunched_image_data = await __class__.tryCrunch(image_data, out_format)
+                if crunched_image_data is not None:
+                    image_data = crunched_image_data
+                else:
+                    # fall back to PIL optimization
+                    image_data = await asyncio.get_running_loop().run_in_executor(
+                        None, functools.partial(post_process, optimize=True)
+                    )
 
             format_changed = need_format_change
         else:
@@ -237,7 +282,7 @@ class CoverSourceResult:
         except Exception:
             return False
 
-    def postProcess(self, images_data, new_format, new_size):
+    def postProcess(self, images_data, new_format, new_size, *, optimize=True):
         """
         Convert image binary data.
 
@@ -247,12 +292,15 @@ class CoverSourceResult:
         if len(images_data) == 1:
             in_bytes = io.BytesIO(images_data[0])
             img = PIL.Image.open(in_bytes)
+            if (new_size is not None) and (img.format == "JPEG"):
+                # let the JPEG decoder do a cheap first downscale, while keeping enough pixels for a quality resize
+                img.draft("RGB", (new_size * 2, new_size * 2))
             if img.mode != "RGB":
                 img = img.convert("RGB")
 
         else:
             # images need to be joined before further processing
-            logging.getLogger("Cover").info(f"Joining {len(images_data)} images...")
+            logger.info("Joining %u images...", len(images_data))
             # TODO find a way to do this losslessly for JPEG
             new_img = PIL.Image.new("RGB", self.size)
             assert is_square(len(images_data))
@@ -279,22 +327,22 @@ class CoverSourceResult:
 
         out_bytes = io.BytesIO()
         if new_size is not None:
-            logging.getLogger("Cover").info(f"Resizing from {self.size[0]}x{self.size[1]} to {new_size}x{new_size}...")
-            img = img.resize((new_size, new_size), PIL.Image.LANCZOS)
+            logger.info("Resizing from %ux%u to %ux%u...", self.size[0], self.size[1], new_size, new_size)
+            img = img.resize((new_size, new_size), PIL.Image.LANCZOS, reducing_gap=3.0)
             # apply unsharp filter to remove resize blur (equivalent to (images/graphics)magick -unsharp 1.5x1+0.7+0.02)
             # we don't use PIL.ImageFilter.SHARPEN or PIL.ImageEnhance.Sharpness because we want precise control over
             # parameters
             unsharper = PIL.ImageFilter.UnsharpMask(radius=1.5, percent=70, threshold=5)
             img = img.filter(unsharper)
         if new_format is not None:
-            logging.getLogger("Cover").info(f"Converting to {new_format.name.upper()}...")
+            logger.info("Converting to %s...", new_format.name.upper())
             target_format = new_format
         else:
             target_format = self.format
-        img.save(out_bytes, format=target_format.name, quality=90, optimize=True)
+        img.save(out_bytes, format=target_format.name, quality=90, optimize=optimize)
         return out_bytes.getvalue()
 
-    async def updateImageMetadata(self):  # noqa: C901
+    async def updateImageMetadata(self):
         """Download image file(s) partially to get its real metadata, or get it from cache."""
         assert self.needMetadataUpdate()
 
@@ -309,85 +357,102 @@ class CoverSourceResult:
                 if x == y:
                     idxs.append((x * sq + y, x, y))
 
+        # one image after the other, each one updates the result metadata, which changes what the next one needs
         for idx, x, y in idxs:
-            url = self.urls[idx]
-            format, width, height = None, None, None
+            url_metadata = await self.getUrlMetadata(self.urls[idx])
+            if url_metadata is None:
+                # metadata is missing for this image, result has already been updated accordingly
+                return
 
-            try:
-                format, width, height = pickle.loads(__class__.metadata_cache[url])
-            except KeyError:
-                # cache miss
-                pass
-            except Exception as e:
-                logging.getLogger("Cover").warning(
-                    f"Unable to load metadata for URL {url!r} from cache: {e.__class__.__qualname__} {e}"
-                )
-            else:
-                # cache hit
-                logging.getLogger("Cover").debug(f"Got metadata for URL {url!r} from cache")
-                if format is not None:
-                    self.setFormatMetadata(format)
+            # sum sizes
+            width, height = url_metadata
+            if (width is not None) and (height is not None):
+                width_sum += width
+                height_sum += height
 
-            if self.needMetadataUpdate(CoverImageMetadata.FORMAT) or (
-                self.needMetadataUpdate(CoverImageMetadata.SIZE) and ((width is None) or (height is None))
-            ):
-                # download
-                logging.getLogger("Cover").debug(f"Downloading file header for URL {url!r}...")
+        if self.needMetadataUpdate(CoverImageMetadata.SIZE) and (width_sum > 0) and (height_sum > 0):
+            self.setSizeMetadata((width_sum, height_sum))
+
+    async def getUrlMetadata(self, url):  # noqa: C901
+        """
+        Get metadata for one of the image URLs, and update the result with it.
+
+        Return a (width, height) tuple, with None values if size is unknown, or None if metadata update must stop.
+        """
+        format, width, height = None, None, None
+
+        try:
+            format_value, cached_width, cached_height = __class__.METADATA_CACHE_STRUCT.unpack(
+                __class__.metadata_cache[url]
+            )
+            format = CoverImageFormat(format_value) if format_value else None
+            width, height = cached_width or None, cached_height or None
+        except KeyError:
+            # cache miss
+            pass
+        except Exception as e:
+            logger.warning("Unable to load metadata for URL %r from cache: %s %s", url, e.__class__.__qualname__, e)
+        else:
+            # cache hit
+            logger.debug("Got metadata for URL %r from cache", url)
+            if format is not None:
+                self.setFormatMetadata(format)
+
+        if self.needMetadataUpdate(CoverImageMetadata.FORMAT) or (
+            self.needMetadataUpdate(CoverImageMetadata.SIZE) and ((width is None) or (height is None))
+        ):
+            # download
+            logger.debug("Downloading file header for URL %r...", url)
+            try:
+                headers = {}
+                self.source.updateHttpHeaders(headers)
+                # we will never read more than that, so avoid having the server send the full file
+                headers["Range"] = f"bytes=0-{__class__.MAX_FILE_METADATA_PEEK_SIZE - 1}"
+                response = await self.source.http.fastStreamedQuery(url, headers=headers, verify=False)
                 try:
-                    headers = {}
-                    self.source.updateHttpHeaders(headers)
-                    response = await self.source.http.fastStreamedQuery(url, headers=headers, verify=False)
-                    try:
-                        if self.needMetadataUpdate(CoverImageMetadata.FORMAT):
-                            # try to get format from response
-                            format = __class__.guessImageFormatFromHttpResponse(response)
+                    if self.needMetadataUpdate(CoverImageMetadata.FORMAT):
+                        # try to get format from response
+                        format = __class__.guessImageFormatFromHttpResponse(response)
+                        if format is not None:
+                            self.setFormatMetadata(format)
+
+                    if self.needMetadataUpdate():
+                        # try to get metadata from HTTP data
+                        metadata = await __class__.guessImageMetadataFromHttpData(response)
+                        if metadata is not None:
+                            format, width, height = metadata
                             if format is not None:
                                 self.setFormatMetadata(format)
 
-                        if self.needMetadataUpdate():
-                            # try to get metadata from HTTP data
-                            metadata = await __class__.guessImageMetadataFromHttpData(response)
-                            if metadata is not None:
-                                format, width, height = metadata
-                                if format is not None:
-                                    self.setFormatMetadata(format)
+                finally:
+                    await response.release()
 
-                    finally:
-                        await response.release()
+            except Exception as e:
+                logger.warning("Failed to get file metadata for URL %r (%s %s)", url, e.__class__.__qualname__, e)
 
-                except Exception as e:
-                    logging.getLogger("Cover").warning(
-                        f"Failed to get file metadata for URL {url!r} ({e.__class__.__qualname__} {e})"
+            if self.needMetadataUpdate():  # did we fail to get needed metadata at this point?
+                if (self.format is None) or ((self.size is None) and ((width is None) or (height is None))):
+                    # if we get here, file is probably not reachable, or not even an image
+                    logger.debug(
+                        "Unable to get file metadata from file or HTTP headers for URL %r, skipping this result", url
                     )
+                    return None
 
-                if self.needMetadataUpdate():  # did we fail to get needed metadata at this point?
-                    if (self.format is None) or ((self.size is None) and ((width is None) or (height is None))):
-                        # if we get here, file is probably not reachable, or not even an image
-                        logging.getLogger("Cover").debug(
-                            f"Unable to get file metadata from file or HTTP headers for URL {url!r}, "
-                            "skipping this result"
-                        )
-                        return
-
-                    if (self.format is not None) and ((self.size is not None) and (width is None) and (height is None)):
-                        logging.getLogger("Cover").debug(
-                            f"Unable to get file metadata from file or HTTP headers for URL {url!r}, "
-                            "falling back to API data"
-                        )
-                        self.check_metadata = CoverImageMetadata.NONE
-                        self.reliable_metadata = False
-                        return
-
-                # save it to cache
-                __class__.metadata_cache[url] = pickle.dumps((format, width, height))
+                if (self.format is not None) and ((self.size is not None) and (width is None) and (height is None)):
+                    logger.debug(
+                        "Unable to get file metadata from file or HTTP headers for URL %r, falling back to API data",
+                        url,
+                    )
+                    self.check_metadata = CoverImageMetadata.NONE
+                    self.reliable_metadata = False
+                    return None
 
-            # sum sizes
-            if (width is not None) and (height is not None):
-                width_sum += width
-                height_sum += height
+            # save it to cache
+            __class__.metadata_cache[url] = __class__.METADATA_CACHE_STRUCT.pack(
+                format.value if format is not None else 0, width or 0, height or 0
+            )
 
-        if self.needMetadataUpdate(CoverImageMetadata.SIZE) and (width_sum > 0) and (height_sum > 0):
-            self.setSizeMetadata((width_sum, height_sum))
+        return width, height
 
     def needMetadataUpdate(self, what=CoverImageMetadata.ALL):
         """Return True if image metadata needs to be checked, False instead."""
@@ -408,11 +473,11 @@ class CoverSourceResult:
         assert self.thumbnail_sig is None
 
         if self.thumbnail_url is None:
-            logging.getLogger("Cover").warning(f"No thumbnail available for {self}")
+            logger.warning("No thumbnail available for %s", self)
             return
 
         # download
-        logging.getLogger("Cover").debug(f"Downloading cover thumbnail {self.thumbnail_url!r}...")
+        logger.debug("Downloading cover thumbnail %r...", self.thumbnail_url)
         headers = {}
         self.source.updateHttpHeaders(headers)
 
@@ -424,19 +489,15 @@ class CoverSourceResult:
                 self.thumbnail_url, cache=__class__.image_cache, headers=headers, pre_cache_callback=pre_cache_callback
             )
         except Exception as e:
-            logging.getLogger("Cover").warning(
-                f"Download of {self.thumbnail_url!r} failed: {e.__class__.__qualname__} {e}"
-            )
+            logger.warning("Download of %r failed: %s %s", self.thumbnail_url, e.__class__.__qualname__, e)
             return
 
         # compute sig
-        logging.getLogger("Cover").debug(f"Computing signature of {self}...")
+        logger.debug("Computing signature of %s...", self)
         try:
             self.thumbnail_sig = __class__.computeImgSignature(image_data)
         except Exception as e:
-            logging.getLogger("Cover").warning(
-                f"Failed to compute signature of '{self}': {e.__class__.__qualname__} {e}"
-            )
+            logger.warning("Failed to compute signature of '%s': %s %s", self, e.__class__.__qualname__, e)
         else:
             await store_in_cache_callback()
 
@@ -536,46 +597,72 @@ class CoverSourceResult:
         # fuck, they are the same!
         return 0
 
+    @staticmethod
+    def canCrunch(format):
+        """Return True if a crunching tool is available for an image format, False otherwise."""
+        if format is CoverImageFormat.PNG:
+            return has_program("optipng") or has_program("oxipng")
+        if format is CoverImageFormat.JPEG:
+            return has_program("jpegoptim")
+        return False
+
     @staticmethod
     async def crunch(image_data, format, silent=False):
         """Crunch image data, and return the processed data, or orignal data if operation failed."""
-        if ((format is CoverImageFormat.PNG) and (not (HAS_OPTIPNG or HAS_OXIPNG))) or (
-            (format is CoverImageFormat.JPEG) and (not HAS_JPEGOPTIM)
-        ):
-            return image_data
-        with mkstemp_ctx.mkstemp(suffix=f".{format.name.lower()}") as tmp_out_filepath:
-            if not silent:
-                logging.getLogger("Cover").info(f"Crunching {format.name.upper()} image...")
-            with open(tmp_out_filepath, "wb") as tmp_out_file:
-                tmp_out_file.write(image_data)
-            size_before = len(image_data)
-            if format is CoverImageFormat.PNG:
-                if HAS_OXIPNG:
-                    cmd = ["oxipng", "-q", "-s"]
-                else:
-                    cmd = ["optipng", "-quiet", "-o1"]
-            elif format is CoverImageFormat.JPEG:
-                cmd = ["jpegoptim", "-q", "--strip-all"]
-            cmd.append(tmp_out_filepath)
-            p = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdin=asyncio.subprocess.DEVNULL,
-                stdout=asyncio.subprocess.DEVNULL,
-                stderr=asyncio.subprocess.DEVNULL,
-            )
-            await p.wait()
-            if p.returncode != 0:
-                if not silent:
-                    logging.getLogger("Cover").warning("Crunching image failed")
-                return image_data
-            with open(tmp_out_filepath, "rb") as tmp_out_file:
-                crunched_image_data = tmp_out_file.read()
-            size_after = len(crunched_image_data)
-            pct_saved = 100 * (size_before - size_after) / size_before
+        crunched_image_data = await __class__.tryCrunch(image_data, format, silent=silent)
+        return crunched_image_data if crunched_image_data is not None else image_data
+
+    @staticmethod
+    async def tryCrunch(image_data, format, silent=False):
+        """Crunch image data, and return the processed data, or None if operation failed or is not possible."""
+        if not __class__.canCrunch(format):
+            return None
+        if not silent:
+            logger.info("Crunching %s image...", format.name.upper())
+        size_before = len(image_data)
+        returncode, crunched_image_data = None, None
+        try:
+            if (format is CoverImageFormat.PNG) and (not has_program("oxipng")):
+                # optipng can only work in place, so go through a temporary file
+                with mkstemp_ctx.mkstemp(suffix=f".{format.name.lower()}") as tmp_out_filepath:
+                    with open(tmp_out_filepath, "wb") as tmp_out_file:
+                        tmp_out_file.write(image_data)
+                    returncode, _ = await __class__.runCrunchCommand(["optipng", "-quiet", "-o1", tmp_out_filepath])
+                    if returncode == 0:
+                        with open(tmp_out_filepath, "rb") as tmp_out_file:
+                            crunched_image_data = tmp_out_file.read()
+            else:
+                # pipe data in and out of the process, to avoid the temporary file round trip
+                if format is CoverImageFormat.PNG:
+                    cmd = ["oxipng", "-q", "-s", "--stdout", "-"]
+                elif format is CoverImageFormat.JPEG:
+                    cmd = ["jpegoptim", "-q", "--strip-all", "--stdin", "--stdout"]
+                returncode, crunched_image_data = await __class__.runCrunchCommand(cmd, image_data)
+        except OSError as e:
+            # tool may have been removed or may not be executable, this is not fatal
+            logger.debug("Unable to run image crunching tool: %s %s", e.__class__.__qualname__, e)
+        if (returncode != 0) or (not crunched_image_data):
             if not silent:
-                logging.getLogger("Cover").debug(f"Crunching image saved {pct_saved:.2f}% filesize")
+                logger.warning("Crunching image failed")
+            return None
+        size_after = len(crunched_image_data)
+        pct_saved = 100 * (size_before - size_after) / size_before
+        if not silent:
+            logger.debug("Crunching image saved %.2f%% filesize", pct_saved)
         return crunched_image_data
 
+    @staticmethod
+    async def runCrunchCommand(cmd, stdin_data=None):
+        """Run an image crunching command, and return a tuple of its return code and standard output data."""
+        p = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL if stdin_data is None else asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout_data, _ = await p.communicate(stdin_data)
+        return p.returncode, stdout_data
+
     @staticmethod
     def guessImageMetadataFromData(img_data):
         """Identify an image format and size from its first bytes."""
@@ -642,16 +729,13 @@ class CoverSourceResult:
     async def preProcessForComparison(results, target_size, size_tolerance_prct):
         """Process results to prepare them for future comparison and sorting."""
         # find reference (=image most likely to match target cover ignoring factors like size and format)
-        reference = None
-        for result in results:
-            if result.source_quality.isReference():
-                if (reference is None) or (
-                    CoverSourceResult.compare(
-                        result, reference, target_size=target_size, size_tolerance_prct=size_tolerance_prct
-                    )
-                    > 0
-                ):
-                    reference = result
+        reference = max(
+            filter(lambda r: r.source_quality.isReference(), results),
+            key=functools.cmp_to_key(
+                functools.partial(__class__.compare, target_size=target_size, size_tolerance_prct=size_tolerance_prct)
+            ),
+            default=None,
+        )
 
         # remove results that are only refs
         results = list(itertools.filterfalse(operator.attrgetter("is_only_reference"), results))
@@ -677,11 +761,11 @@ class CoverSourceResult:
                 no_dup_results.append(result)
         dup_count = len(results) - len(no_dup_results)
         if dup_count > 0:
-            logging.getLogger("Cover").info(f"Removed {dup_count} duplicate results")
+            logger.info("Removed %u duplicate results", dup_count)
             results = no_dup_results
 
         if reference is not None:
-            logging.getLogger("Cover").info(f"Reference is: {reference}")
+            logger.info("Reference is: %s", reference)
             reference.is_similar_to_reference = True
 
             # calculate sigs
@@ -711,11 +795,11 @@ class CoverSourceResult:
                         result.thumbnail_sig, reference.thumbnail_sig
                     )
                     if result.is_similar_to_reference:
-                        logging.getLogger("Cover").debug(f"{result} is similar to reference")
+                        logger.debug("%s is similar to reference", result)
                     else:
-                        logging.getLogger("Cover").debug(f"{result} is NOT similar to reference")
+                        logger.debug("%s is NOT similar to reference", result)
         else:
-            logging.getLogger("Cover").warning("No reference result found")
+            logger.warning("No reference result found")
 
         return results
 
@@ -728,27 +812,20 @@ class CoverSourceResult:
         See: https://github.com/JohannesBuchner/imagehash/blob/4.0/imagehash/__init__.py#L125
 
         """
-        parser = PIL.ImageFile.Parser()
-        parser.feed(image_data)
-        img = parser.close()
+        # open lazily, so that thumbnail() can decode JPEG directly at a reduced scale
+        img = PIL.Image.open(io.BytesIO(image_data))
         target_size = (__class__.IMG_SIG_SIZE, __class__.IMG_SIG_SIZE)
         img.thumbnail(target_size, PIL.Image.Resampling.BICUBIC)
         if img.size != target_size:
-            logging.getLogger("Cover").debug(
-                "Non square thumbnail after resize to %ux%u, unable to compute signature" % target_size
-            )
+            logger.debug("Non square thumbnail after resize to %ux%u, unable to compute signature", *target_size)
             return None
         img = img.convert(mode="RGB")
-        pixels = img.getdata()
-        pixel_count = target_size[0] * target_size[1]
-        color_count = 3
-        r = bitarray.bitarray(pixel_count * color_count)
-        r.setall(False)
-        for ic in range(color_count):
-            mean = sum(p[ic] for p in pixels) // pixel_count
-            for ip, p in enumerate(pixels):
-                if p[ic] > mean:
-                    r[pixel_count * ic + ip] = True
+        r = bitarray.bitarray()
+        for band in img.split():
+            band_data = band.tobytes()
+            mean = sum(band_data) // len(band_data)
+            # map each pixel value to a '0' or '1' char depending on its position relative to the mean, all in C code
+            r.extend(band_data.translate(b"0" * (mean + 1) + b"1" * (255 - mean)).decode("ascii"))
         return r
 
     @staticmethod
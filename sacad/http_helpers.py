@@ -1,15 +1,19 @@
 """Common HTTP code."""
 
 import asyncio
+import functools
+import json
 import logging
 import os
-import pickle
+import random
+import types
 import urllib.parse
+import weakref
 
 import aiohttp
 import appdirs
 
-from sacad import rate_watcher, redo
+from sacad import rate_watcher
 
 
 def aiohttp_socket_timeout(socket_timeout_s):
@@ -22,7 +26,52 @@ HTTP_SHORT_TIMEOUT = aiohttp_socket_timeout(6.1)
 HTTP_MAX_ATTEMPTS = 3
 HTTP_MAX_RETRY_SLEEP_S = 5
 HTTP_MAX_RETRY_SLEEP_SHORT_S = 2
+# time to sleep after each failed attempt (exponential backoff), before jitter
+HTTP_RETRY_SLEEPS_S = tuple(min(HTTP_MAX_RETRY_SLEEP_S, 1 * 1.5**i) for i in range(HTTP_MAX_ATTEMPTS))
+HTTP_RETRY_SLEEPS_SHORT_S = tuple(min(HTTP_MAX_RETRY_SLEEP_SHORT_S, 0.5 * 1.5**i) for i in range(HTTP_MAX_ATTEMPTS))
+HTTP_RETRY_JITTER_S = 0.2
 DEFAULT_USER_AGENT = "Mozilla/5.0"
+# read only, because it is passed as is to every request without custom headers
+DEFAULT_HEADERS = types.MappingProxyType({"User-Agent": DEFAULT_USER_AGENT})
+PROBE_HEADERS_OF_INTEREST = frozenset(("content-type", "content-length", "last-modified", "etag"))
+# probe cache entries are a status byte, optionally followed by JSON encoded headers
+PROBE_CACHE_STATUS_OK = b"1"
+PROBE_CACHE_STATUS_KO = b"0"
+
+# (connector, session count) tuple by event loop, the connector is shared by all sessions of the loop, so that
+# connections and DNS cache are reused across cover sources, and closed with the last session
+shared_connectors: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+@functools.lru_cache(maxsize=4096)
+def url_domain(url):
+    """Return the domain of an URL."""
+    return urllib.parse.urlsplit(url).netloc
+
+
+def acquire_shared_connector():
+    """Get the connector shared by the HTTP sessions of the running event loop, and create it if needed."""
+    loop = asyncio.get_running_loop()
+    connector, session_count = shared_connectors.get(loop, (None, 0))
+    if (connector is None) or connector.closed:
+        # keep connections and DNS resolutions long enough to be reused by the next queries of a library scan, and
+        # avoid opening too many connections to a single host
+        connector = aiohttp.TCPConnector(limit_per_host=8, ttl_dns_cache=300, keepalive_timeout=60)
+        session_count = 0
+    shared_connectors[loop] = (connector, session_count + 1)
+    return connector
+
+
+async def release_shared_connector(connector):
+    """Release a connector obtained with acquire_shared_connector, and close it if no other session uses it."""
+    loop = asyncio.get_running_loop()
+    shared_connector, session_count = shared_connectors.get(loop, (None, 0))
+    if shared_connector is connector:
+        if session_count > 1:
+            shared_connectors[loop] = (connector, session_count - 1)
+            return
+        del shared_connectors[loop]
+    await connector.close()
 
 
 class Http:
@@ -45,12 +94,16 @@ class Http:
         self.min_delay_between_accesses = min_delay_between_accesses
         self.jitter_range_ms = jitter_range_ms
         self.rate_limited_domains = rate_limited_domains
+        self.rate_watchers = {}
         self.logger = logger
 
     async def close(self):
         """Close HTTP session to make aiohttp happy."""
         if self.session is not None:
+            connector = self.session.connector
             await self.session.close()
+            self.session = None
+            await release_shared_connector(connector)
 
     async def query(  # noqa: C901
         self, url, *, post_data=None, headers=None, verify=True, cache=None, pre_cache_callback=None
@@ -61,44 +114,28 @@ class Http:
         Send a GET/POST request or get data from cache, retry if it fails, and return a tuple of store in cache
         callback, response content.
         """
-
-        async def store_in_cache_callback():
-            pass
-
         if cache is not None:
             # try from cache first
             if post_data is not None:
                 if (url, post_data) in cache:
-                    self.logger.debug(f"Got data for URL {url!r} {dict(post_data)} from cache")
-                    return store_in_cache_callback, cache[(url, post_data)]
+                    self.logger.debug("Got data for URL %r %s from cache", url, dict(post_data))
+                    return self._noStoreInCache, cache[(url, post_data)]
             elif url in cache:
-                self.logger.debug(f"Got data for URL {url!r} from cache")
-                return store_in_cache_callback, cache[url]
+                self.logger.debug("Got data for URL %r from cache", url)
+                return self._noStoreInCache, cache[url]
 
         if self.session is None:
             self._initSession()
 
         # do we need to rate limit?
         if self.rate_limited_domains is not None:
-            domain = urllib.parse.urlsplit(url).path
-            rate_limit = domain in self.rate_limited_domains
+            rate_limit = url_domain(url) in self.rate_limited_domains
         else:
             rate_limit = True
         if rate_limit:
-            domain_rate_watcher = rate_watcher.AccessRateWatcher(
-                self.watcher_db_filepath,
-                url,
-                self.min_delay_between_accesses,
-                jitter_range_ms=self.jitter_range_ms,
-                logger=self.logger,
-            )
+            domain_rate_watcher = self._getRateWatcher(url)
 
-        for attempt, time_to_sleep in enumerate(
-            redo.retrier(
-                max_attempts=HTTP_MAX_ATTEMPTS, sleeptime=1, max_sleeptime=HTTP_MAX_RETRY_SLEEP_S, sleepscale=1.5
-            ),
-            1,
-        ):
+        for attempt, base_time_to_sleep in enumerate(HTTP_RETRY_SLEEPS_S, 1):
             if rate_limit:
                 await domain_rate_watcher.waitAccessAsync()
 
@@ -117,42 +154,64 @@ class Http:
                         url, headers=self._buildHeaders(headers), timeout=HTTP_NORMAL_TIMEOUT, ssl=verify
                     ) as response:
                         content = await response.read()
-
-                if cache is not None:
-
-                    async def store_in_cache_callback():
-                        if pre_cache_callback is not None:
-                            # process
-                            try:
-                                data = await pre_cache_callback(content)
-                            except Exception:
-                                data = content
-                        else:
-                            data = content
-
-                        # add to cache
-                        if post_data is not None:
-                            cache[(url, post_data)] = data
-                        else:
-                            cache[url] = data
+                response.raise_for_status()
 
             except (asyncio.TimeoutError, aiohttp.ClientError) as e:
                 self.logger.warning(
-                    f"Querying {url!r} failed (attempt {attempt}/{HTTP_MAX_ATTEMPTS}): {e.__class__.__qualname_} {e}"
+                    "Querying %r failed (attempt %u/%u): %s %s",
+                    url,
+                    attempt,
+                    HTTP_MAX_ATTEMPTS,
+                    e.__class__.__qualname__,
+                    e,
                 )
+                if isinstance(e, aiohttp.ClientResponseError) and (400 <= e.status < 500) and (e.status != 429):
+                    # client error, retrying will not help
+                    raise
                 if attempt == HTTP_MAX_ATTEMPTS:
                     raise
                 else:
-                    self.logger.debug(f"Retrying in {time_to_sleep:.3f}s")
+                    time_to_sleep = max(
+                        0, base_time_to_sleep + random.uniform(-HTTP_RETRY_JITTER_S, HTTP_RETRY_JITTER_S)
+                    )
+                    self.logger.debug("Retrying in %.3fs", time_to_sleep)
                     await asyncio.sleep(time_to_sleep)
 
             else:
                 break  # http retry loop
 
-        response.raise_for_status()
+        if cache is not None:
+            store_in_cache_callback = functools.partial(
+                self._storeInCache,
+                cache,
+                (url, post_data) if post_data is not None else url,
+                content,
+                pre_cache_callback,
+            )
+        else:
+            store_in_cache_callback = self._noStoreInCache
 
         return store_in_cache_callback, content
 
+    @staticmethod
+    async def _storeInCache(cache, cache_key, content, pre_cache_callback):
+        """Process response content if needed, and store it in cache."""
+        if pre_cache_callback is not None:
+            # process
+            try:
+                data = await pre_cache_callback(content)
+            except Exception:
+                data = content
+        else:
+            data = content
+
+        # add to cache
+        cache[cache_key] = data
+
+    @staticmethod
+    async def _noStoreInCache():
+        """Store in cache callback for content that must not be stored."""
+
     async def isReachable(self, url, *, headers=None, verify=True, response_headers=None, cache=None):
         """
         Send a HEAD request.
@@ -162,72 +221,80 @@ class Http:
         """
         if (cache is not None) and (url in cache):
             # try from cache first
-            self.logger.debug(f"Got headers for URL {url!r} from cache")
-            resp_ok, response_headers = pickle.loads(cache[url])
-            return resp_ok
+            cached_data = cache[url]
+            cached_status = cached_data[:1]
+            if cached_status in (PROBE_CACHE_STATUS_OK, PROBE_CACHE_STATUS_KO):
+                self.logger.debug("Got headers for URL %r from cache", url)
+                if (response_headers is not None) and (len(cached_data) > 1):
+                    response_headers.update(json.loads(cached_data[1:]))
+                return cached_status == PROBE_CACHE_STATUS_OK
+            # else legacy entry, ignore it, it will be overwritten
 
         if self.session is None:
             self._initSession()
 
         # do we need to rate limit?
         if self.rate_limited_domains is not None:
-            domain = urllib.parse.urlsplit(url).path
-            rate_limit = domain in self.rate_limited_domains
+            rate_limit = url_domain(url) in self.rate_limited_domains
         else:
             rate_limit = True
         if rate_limit:
-            domain_rate_watcher = rate_watcher.AccessRateWatcher(
-                self.watcher_db_filepath,
-                url,
-                self.min_delay_between_accesses,
-                jitter_range_ms=self.jitter_range_ms,
-                logger=self.logger,
-            )
+            domain_rate_watcher = self._getRateWatcher(url)
 
         resp_ok = True
+        kept_response_headers = None
         try:
-            for attempt, time_to_sleep in enumerate(
-                redo.retrier(
-                    max_attempts=HTTP_MAX_ATTEMPTS,
-                    sleeptime=0.5,
-                    max_sleeptime=HTTP_MAX_RETRY_SLEEP_SHORT_S,
-                    sleepscale=1.5,
-                ),
-                1,
-            ):
+            for attempt, base_time_to_sleep in enumerate(HTTP_RETRY_SLEEPS_SHORT_S, 1):
                 if rate_limit:
                     await domain_rate_watcher.waitAccessAsync()
 
                 try:
-                    async with self.session.head(
+                    response = await self.session.head(
                         url, headers=self._buildHeaders(headers), timeout=HTTP_SHORT_TIMEOUT, ssl=verify
-                    ) as response:
-                        pass
+                    )
 
                 except (asyncio.TimeoutError, aiohttp.ClientError) as e:
                     self.logger.warning(
-                        f"Probing {url!r} failed (attempt {attempt}/{HTTP_MAX_ATTEMPTS}): {e.__class__.__qualname_} {e}"
+                        "Probing %r failed (attempt %u/%u): %s %s",
+                        url,
+                        attempt,
+                        HTTP_MAX_ATTEMPTS,
+                        e.__class__.__qualname__,
+                        e,
                     )
                     if attempt == HTTP_MAX_ATTEMPTS:
                         resp_ok = False
                     else:
-                        self.logger.debug(f"Retrying in {time_to_sleep:.3f}s")
+                        time_to_sleep = max(
+                            0, base_time_to_sleep + random.uniform(-HTTP_RETRY_JITTER_S, HTTP_RETRY_JITTER_S)
+                        )
+                        self.logger.debug("Retrying in %.3fs", time_to_sleep)
                         await asyncio.sleep(time_to_sleep)
 
                 else:
+                    # there is no body to read for a HEAD request, give back the connection immediately
+                    await response.release()
                     response.raise_for_status()
 
+                    # only keep useful headers, to avoid bloating the cache, they are cached even if the caller does
+                    # not need them, a later call may
+                    kept_response_headers = {
+                        k: v for k, v in response.headers.items() if k.lower() in PROBE_HEADERS_OF_INTEREST
+                    }
                     if response_headers is not None:
-                        response_headers.update(response.headers)
+                        response_headers.update(kept_response_headers)
 
                     break  # http retry loop
         except aiohttp.ClientResponseError as e:
-            self.logger.debug(f"Probing {url!r} failed: {e.__class__.__qualname__} {e}")
+            self.logger.debug("Probing %r failed: %s %s", url, e.__class__.__qualname__, e)
             resp_ok = False
 
         if cache is not None:
             # store in cache
-            cache[url] = pickle.dumps((resp_ok, response_headers))
+            cached_data = PROBE_CACHE_STATUS_OK if resp_ok else PROBE_CACHE_STATUS_KO
+            if kept_response_headers:
+                cached_data += json.dumps(kept_response_headers).encode()
+            cache[url] = cached_data
 
         return resp_ok
 
@@ -240,18 +307,39 @@ class Http:
             url, headers=self._buildHeaders(headers), timeout=HTTP_SHORT_TIMEOUT, ssl=verify
         )
 
-        response.raise_for_status()
+        if not response.ok:
+            # read the (usually small) error body, so that the connection can go back to the pool
+            await response.read()
+            response.raise_for_status()
 
         return response
 
     def _buildHeaders(self, headers):
         """Build HTTP headers dictionary."""
-        if headers is None:
-            headers = {}
+        if not headers:
+            # common case, no need to build a new dict for each request
+            return DEFAULT_HEADERS
         if "User-Agent" not in headers:
             headers["User-Agent"] = DEFAULT_USER_AGENT
         return headers
 
+    def _getRateWatcher(self, url):
+        """Get the access rate watcher for the domain of an URL, and create it on first use."""
+        domain = url_domain(url)
+        try:
+            domain_rate_watcher = self.rate_watchers[domain]
+        except KeyError:
+            domain_rate_watcher = rate_watcher.AccessRateWatcher(
+                self.watcher_db_filepath,
+                url,
+                self.min_delay_between_accesses,
+                jitter_range_ms=self.jitter_range_ms,
+                domain=domain,
+                logger=self.logger,
+            )
+            self.rate_watchers[domain] = domain_rate_watcher
+        return domain_rate_watcher
+
     def _initSession(self):
         """
         Initialize HTTP session.
@@ -264,5 +352,6 @@ class Http:
             cookie_jar = aiohttp.cookiejar.DummyCookieJar()
         else:
             cookie_jar = None
-        connector = aiohttp.TCPConnector()
-        self.session = aiohttp.ClientSession(connector=connector, cookie_jar=cookie_jar)
+        self.session = aiohttp.ClientSession(
+            connector=acquire_shared_connector(), connector_owner=False, cookie_jar=cookie_jar
+        )
@@ -0,0 +1,56 @@
+"""In memory LRU cache, to avoid querying a slower persistent cache for recently used items."""
+
+import collections
+
+
+class LruMemoryCache:
+    """Dict-like cache keeping the most recently used items in memory, in front of a backing cache."""
+
+    def __init__(self, backing_cache, max_items, *, max_bytes=None):
+        self.backing_cache = backing_cache
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.items = collections.OrderedDict()
+        self.size = 0
+
+    def __getattr__(self, name):
+        # delegate everything else (purge, getDbTableName...) to the backing cache
+        return getattr(self.backing_cache, name)
+
+    def __len__(self):
+        return len(self.backing_cache)
+
+    def __contains__(self, key):
+        return (key in self.items) or (key in self.backing_cache)
+
+    def __getitem__(self, key):
+        try:
+            data = self.items[key]
+        except KeyError:
+            data = self.backing_cache[key]
+            self.__remember(key, data)
+        else:
+            self.items.move_to_end(key)
+        return data
+
+    def __setitem__(self, key, data):
+        self.backing_cache[key] = data
+        self.__remember(key, data)
+
+    def __remember(self, key, data):
+        """Store item in memory, evicting the least recently used ones if needed."""
+        self.__forget(key)
+        if (self.max_bytes is not None) and (len(data) > self.max_bytes):
+            # too big to be kept, it would evict everything else
+            return
+        self.items[key] = data
+        self.size += len(data)
+        while (len(self.items) > self.max_items) or ((self.max_bytes is not None) and (self.size > self.max_bytes)):
+            _, evicted_data = self.items.popitem(last=False)
+            self.size -= len(evicted_data)
+
+    def __forget(self, key):
+        """Remove item from memory if it is there."""
+        data = self.items.pop(key, None)
+        if data is not None:
+            self.size -= len(data)
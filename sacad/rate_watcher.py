@@ -5,6 +5,7 @@ import logging
 import os
 import random
 import sqlite3
+import threading
 import time
 import urllib.parse
 
@@ -12,66 +13,105 @@ import urllib.parse
 class AccessRateWatcher:
     """Access rate limiter, supporting concurrent access by threads and/or processes."""
 
+    # last access timestamp by (database path, domain) for this process, to predict the wait without a database query
+    last_accesses = {}
+    # database connections by path, shared by all instances of the same thread, because SQLite objects can not be
+    # used from another thread
+    thread_local = threading.local()
+
     def __init__(
-        self, db_filepath, url, min_delay_between_accesses, *, jitter_range_ms=None, logger=logging.getLogger()
+        self,
+        db_filepath,
+        url,
+        min_delay_between_accesses,
+        *,
+        jitter_range_ms=None,
+        domain=None,
+        logger=logging.getLogger(),
     ):
-        self.domain = urllib.parse.urlsplit(url).netloc
+        self.domain = domain if domain is not None else urllib.parse.urlsplit(url).netloc
+        self.last_access_key = (db_filepath, self.domain)
         self.min_delay_between_accesses = min_delay_between_accesses
         self.jitter_range_ms = jitter_range_ms
         self.logger = logger
-        os.makedirs(os.path.dirname(db_filepath), exist_ok=True)
-        self.connection = sqlite3.connect(db_filepath)
-        with self.connection:
-            self.connection.executescript(
-                """CREATE TABLE IF NOT EXISTS access_timestamp (domain TEXT PRIMARY KEY,
-                                                                                    timestamp FLOAT NOT NULL);"""
-            )
+        self.connection = __class__.getConnection(db_filepath)
         self.lock = None
 
+    @classmethod
+    def getConnection(cls, db_filepath):
+        """Get the database connection for this thread, and create the database on first use."""
+        try:
+            connections = cls.thread_local.connections
+        except AttributeError:
+            connections = cls.thread_local.connections = {}
+        try:
+            connection = connections[db_filepath]
+        except KeyError:
+            os.makedirs(os.path.dirname(db_filepath), exist_ok=True)
+            connection = sqlite3.connect(db_filepath, isolation_level=None)
+            # WAL lets readers run concurrently with the writer, and with synchronous=NORMAL commits do not need fsync,
+            # losing the last accesses on power loss is harmless
+            connection.executescript(
+                """PRAGMA journal_mode = WAL;
+                   PRAGMA synchronous = NORMAL;
+                   CREATE TABLE IF NOT EXISTS access_timestamp (domain TEXT PRIMARY KEY,
+                                                                timestamp FLOAT NOT NULL) WITHOUT ROWID;"""
+            )
+            connections[db_filepath] = connection
+        return connection
+
     async def waitAccessAsync(self):
         """Wait the needed time before sending a request to honor rate limit."""
         if self.lock is None:
             self.lock = asyncio.Lock()
 
         async with self.lock:
-            while True:
-                last_access_ts = self.__getLastAccess()
-                if last_access_ts is not None:
-                    now = time.time()
-                    last_access_ts = last_access_ts[0]
-                    time_since_last_access = now - last_access_ts
-                    if time_since_last_access < self.min_delay_between_accesses:
-                        time_to_wait = self.min_delay_between_accesses - time_since_last_access
-                        if self.jitter_range_ms is not None:
-                            time_to_wait += random.randint(*self.jitter_range_ms) / 1000
-                        self.logger.debug(
-                            "Sleeping for %.2fms because of rate limit for domain %s"
-                            % (time_to_wait * 1000, self.domain)
-                        )
-                        await asyncio.sleep(time_to_wait)
+            # if this process accessed the domain recently, sleep first, the database check below will then most
+            # likely not need to wait again
+            last_access_ts = __class__.last_accesses.get(self.last_access_key)
+            if last_access_ts is not None:
+                await self.__wait(self.__timeToWait(last_access_ts))
 
-                access_time = time.time()
-                self.__access(access_time)
-
-                # now we should be good... except if another process did the same query at the same time
-                # the database serves as an atomic lock, query again to be sure the last row is the one
-                # we just inserted
-                last_access_ts = self.__getLastAccess()
-                if last_access_ts[0] == access_time:
+            while True:
+                time_to_wait = self.__tryAccess()
+                if time_to_wait is None:
                     break
+                await self.__wait(time_to_wait)
 
-    def __getLastAccess(self):
-        with self.connection:
-            return self.connection.execute(
-                """SELECT timestamp
-                                        FROM access_timestamp
-                                        WHERE domain = ?;""",
-                (self.domain,),
-            ).fetchone()
+    def __timeToWait(self, last_access_ts):
+        """Return the time to wait in seconds to honor rate limit, given the last access timestamp."""
+        time_since_last_access = time.time() - last_access_ts
+        if time_since_last_access >= self.min_delay_between_accesses:
+            return 0
+        time_to_wait = self.min_delay_between_accesses - time_since_last_access
+        if self.jitter_range_ms is not None:
+            time_to_wait += random.randint(*self.jitter_range_ms) / 1000
+        return time_to_wait
 
-    def __access(self, ts):
-        """Record an API access."""
-        with self.connection:
-            self.connection.execute(
-                "INSERT OR REPLACE INTO access_timestamp (timestamp, domain) VALUES (?, ?)", (ts, self.domain)
+    async def __wait(self, time_to_wait):
+        """Sleep for the given time if needed."""
+        if time_to_wait > 0:
+            self.logger.debug(
+                "Sleeping for %.2fms because of rate limit for domain %s", time_to_wait * 1000, self.domain
             )
+            await asyncio.sleep(time_to_wait)
+
+    def __tryAccess(self):
+        """Record an access if rate limit allows it, return None if it was recorded, or the time to wait otherwise."""
+        # the conditional upsert checks and records the access atomically in a single statement, even with several
+        # processes
+        access_time = time.time()
+        cursor = self.connection.execute(
+            """INSERT INTO access_timestamp (domain, timestamp) VALUES (?, ?)
+               ON CONFLICT (domain) DO UPDATE SET timestamp = excluded.timestamp
+               WHERE excluded.timestamp - access_timestamp.timestamp >= ?;""",
+            (self.domain, access_time, self.min_delay_between_accesses),
+        )
+        if cursor.rowcount == 1:
+            __class__.last_accesses[self.last_access_key] = access_time
+            return None
+
+        last_access_ts = self.connection.execute(
+            "SELECT timestamp FROM access_timestamp WHERE domain = ?;", (self.domain,)
+        ).fetchone()
+        return self.__timeToWait(last_access_ts[0]) if last_access_ts is not None else 0
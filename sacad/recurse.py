@@ -6,18 +6,27 @@ import argparse
 import asyncio
 import base64
 import collections
+import concurrent.futures
 import contextlib
+import functools
 import inspect
 import itertools
 import logging
+import logging.handlers
 import mimetypes
-import operator
+import multiprocessing
 import os
 import string
 import sys
 import tempfile
+import time
 
 import mutagen
+import mutagen._vorbis
+import mutagen.apev2
+import mutagen.flac
+import mutagen.id3
+import mutagen.mp4
 import tqdm
 import unidecode
 
@@ -31,8 +40,20 @@ AUDIO_EXTENSIONS = frozenset(
     ext for ext, mime in {**mimetypes.types_map, **mimetypes.common_types}.items() if mime.startswith("audio/")
 )
 
+PROGRESS_POSTFIX_MIN_INTERVAL_S = 0.5
+ANALYZE_SERIAL_MAX_DIR_COUNT = 64
+ANALYZE_MAX_PENDING_DIRS = 128
+
 Metadata = collections.namedtuple("Metadata", ("artist", "album", "has_embedded_cover"))
 
+# tags type, artist keys, album keys, in order of preference
+TAG_KEYS = (
+    (mutagen._vorbis.VComment, ("albumartist", "artist"), ("_album", "album")),
+    (mutagen.id3.ID3, ("TPE2", "TPE1"), ("TALB",)),
+    (mutagen.mp4.MP4Tags, ("aART", "\xa9ART"), ("\xa9alb",)),
+    (mutagen.apev2.APEv2, ("albumartist", "artist"), ("_album", "album")),
+)
+
 
 # TODO use a dataclasses.dataclass when Python < 3.7 is dropped
 class Work:
@@ -77,22 +98,90 @@ def analyze_lib(lib_dir, cover_pattern, *, ignore_existing=False, full_scan=Fals
     with tqdm.tqdm(desc="Analyzing library", unit="dir", postfix=stats) as progress, tqdm_logging.redirect_logging(
         progress
     ):
-        for rootpath, rel_dirpaths, rel_filepaths in os.walk(lib_dir):
-            new_work = analyze_dir(
-                stats,
-                rootpath,
-                rel_filepaths,
-                cover_pattern,
-                ignore_existing=ignore_existing,
-                full_scan=full_scan,
-                all_formats=all_formats,
-            )
-            progress.set_postfix(stats, refresh=False)
-            progress.update(1)
+        analyze_walk_dir = functools.partial(
+            analyze_dir_job,
+            cover_pattern=cover_pattern,
+            ignore_existing=ignore_existing,
+            full_scan=full_scan,
+            all_formats=all_formats,
+        )
+        last_postfix_update = 0
+
+        def add_dir_results(dir_results):
+            nonlocal last_postfix_update
+            dir_stats, new_work = dir_results
+            for k, v in dir_stats.items():
+                stats[k] += v
+            last_postfix_update = update_progress(progress, stats, last_postfix_update)
             work.extend(new_work)
+
+        # small libraries are analyzed faster in this process than by starting worker processes, and so is any library
+        # with a single CPU
+        walk = os.walk(lib_dir)
+        serial_dir_count = ANALYZE_SERIAL_MAX_DIR_COUNT if (os.cpu_count() or 1) > 1 else None
+        for walk_entry in itertools.islice(walk, serial_dir_count):
+            add_dir_results(analyze_walk_dir(walk_entry))
+
+        walk_entry = next(walk, None)
+        if walk_entry is not None:
+            # larger library, analyze directories in several processes, so that reading files and parsing tags overlap
+            # this process runs threads (log listener, progress bar monitor), so do not fork it, whatever the platform
+            # default start method is
+            mp_context = multiprocessing.get_context("spawn")
+            # worker processes send their log records back to this process, to go through the tqdm logging handler
+            log_queue = mp_context.Queue()
+            log_listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers)
+            log_listener.start()
+            try:
+                with concurrent.futures.ProcessPoolExecutor(
+                    mp_context=mp_context,
+                    initializer=init_analyze_worker,
+                    initargs=(log_queue, logging.getLogger("sacad_r").getEffectiveLevel()),
+                ) as executor:
+                    # only keep a bounded window of directories submitted, so that results stream while walking, and
+                    # the listings of the whole library are not held in memory
+                    pending = collections.deque()
+                    for walk_entry in itertools.chain((walk_entry,), walk):
+                        if len(pending) >= ANALYZE_MAX_PENDING_DIRS:
+                            add_dir_results(pending.popleft().result())
+                        pending.append(executor.submit(analyze_walk_dir, walk_entry))
+                    while pending:
+                        add_dir_results(pending.popleft().result())
+            finally:
+                log_listener.stop()
+
+        progress.set_postfix(stats, refresh=False)
     return work
 
 
+def update_progress(progress, stats, last_postfix_update):
+    """Advance progress bar, update its stats if they were not updated recently, and return the last update time."""
+    # formatting the stats is relatively costly, and not needed for every progress step
+    now = time.monotonic()
+    if now - last_postfix_update >= PROGRESS_POSTFIX_MIN_INTERVAL_S:
+        progress.set_postfix(stats, refresh=False)
+        last_postfix_update = now
+    progress.update(1)
+    return last_postfix_update
+
+
+def init_analyze_worker(log_queue, log_level):
+    """Set up logging for a library analysis worker process."""
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers.copy():
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logging.getLogger("sacad_r").setLevel(log_level)
+
+
+def analyze_dir_job(walk_entry, cover_pattern, **kwargs):
+    """Analyze a directory from an os.walk entry, possibly in a worker process, and return a tuple of stats, work."""
+    parent_dir, _, rel_filepaths = walk_entry
+    stats = collections.Counter()
+    work = analyze_dir(stats, parent_dir, rel_filepaths, cover_pattern, **kwargs)
+    return stats, work
+
+
 def get_file_metadata(audio_filepath):
     """Get a Metadata object for this file or None."""
     try:
@@ -102,12 +191,16 @@ def get_file_metadata(audio_filepath):
     if mf is None:
         return
 
+    for tags_type, artist_keys, album_keys in TAG_KEYS:
+        if isinstance(mf.tags, tags_type):
+            break
+    else:
+        # unknown tag format
+        return
+
     # artist
-    for key in ("albumartist", "TPE2", "aART", "artist", "TPE1", "\xa9ART"):  # ogg/ape, mp3, mp4
-        try:
-            val = mf.get(key, None)
-        except ValueError:
-            val = None
+    for key in artist_keys:
+        val = mf.get(key, None)
         if val is not None:
             artist = val[-1]
             break
@@ -115,11 +208,8 @@ def get_file_metadata(audio_filepath):
         return
 
     # album
-    for key in ("_album", "album", "TALB", "\xa9alb"):  # ogg/ape, mp3, mp4
-        try:
-            val = mf.get(key, None)
-        except ValueError:
-            val = None
+    for key in album_keys:
+        val = mf.get(key, None)
         if val is not None:
             album = val[-1]
             break
@@ -127,20 +217,18 @@ def get_file_metadata(audio_filepath):
         return
 
     # album art
-    if isinstance(mf.tags, mutagen._vorbis.VComment):
+    if tags_type is mutagen._vorbis.VComment:
         has_embedded_cover = ("metadata_block_picture" in mf) or (
             isinstance(mf, mutagen.flac.FLAC)
             and any((p.type == mutagen.id3.PictureType.COVER_FRONT) for p in mf.pictures)
         )
-    elif isinstance(mf.tags, mutagen.id3.ID3):
-        has_embedded_cover = any(map(operator.methodcaller("startswith", "APIC:"), mf.keys()))
-    elif isinstance(mf.tags, mutagen.mp4.MP4Tags):
+    elif tags_type is mutagen.id3.ID3:
+        # picture frames without description (like the ones we write) have the "APIC:" key, check it directly first
+        has_embedded_cover = ("APIC:" in mf.tags) or any(k.startswith("APIC:") for k in mf.tags.keys())
+    elif tags_type is mutagen.mp4.MP4Tags:
         has_embedded_cover = "covr" in mf
-    elif isinstance(mf.tags, mutagen.apev2.APEv2):
-        has_embedded_cover = "cover art (front)" in mf
     else:
-        # unknown tag format
-        return
+        has_embedded_cover = "cover art (front)" in mf
 
     return Metadata(artist, album, has_embedded_cover)
 
@@ -167,12 +255,16 @@ def get_dir_metadata(audio_filepaths, *, full_scan=False):
 
 
 VALID_PATH_CHARS = frozenset(r"-_.()!#$%&'@^{}~" + string.ascii_letters + string.digits + " ")
+SEPARATOR_CHARS_TRANSLATION = str.maketrans("/\\|*", "---x")
+# unidecode output is ASCII, so only ASCII chars need to be removed
+INVALID_PATH_CHARS_TRANSLATION = dict.fromkeys(c for c in range(128) if chr(c) not in VALID_PATH_CHARS)
 
 
+@functools.lru_cache(maxsize=4096)
 def sanitize_for_path(s):
     """Sanitize a string to be FAT/NTFS friendly when used in file path."""
-    s = s.translate(str.maketrans("/\\|*", "---x"))
-    s = "".join(c for c in unidecode.unidecode_expect_ascii(s) if c in VALID_PATH_CHARS)
+    s = s.translate(SEPARATOR_CHARS_TRANSLATION)
+    s = unidecode.unidecode_expect_ascii(s).translate(INVALID_PATH_CHARS_TRANSLATION)
     s = s.strip()
     s = s.rstrip(".")  # this if for FAT on Android
     return s
@@ -198,13 +290,11 @@ def analyze_dir(
     # filter out non audio files
     audio_filepaths = []
     for rel_filepath in rel_filepaths:
-        stats["files"] += 1
-        try:
-            ext = os.path.splitext(rel_filepath)[1][1:].lower()
-        except IndexError:
-            continue
-        if ext in AUDIO_EXTENSIONS:
+        # faster than os.path.splitext, with the same handling of leading dots (hidden files without extension)
+        name, _, ext = rel_filepath.rpartition(".")
+        if name.lstrip(".") and (ext.lower() in AUDIO_EXTENSIONS):
             audio_filepaths.append(os.path.join(parent_dir, rel_filepath))
+    stats["files"] += len(rel_filepaths)
 
     # get metadata
     dir_metadata = get_dir_metadata(audio_filepaths, full_scan=full_scan)
@@ -274,16 +364,6 @@ def embed_album_art(cover_filepath, audio_filepaths):
         mf.save()
 
 
-def ichunk(iterable, n):
-    """Split an iterable into n-sized chunks."""
-    it = iter(iterable)
-    while True:
-        chunk = tuple(itertools.islice(it, n))
-        if not chunk:
-            return
-        yield chunk
-
-
 def get_covers(work, args):
     """Get missing covers."""
     with contextlib.ExitStack() as cm:
@@ -298,10 +378,27 @@ def get_covers(work, args):
         )
         cm.enter_context(tqdm_logging.redirect_logging(progress))
 
-        def post_download(future):
-            work = futures[future]
+        async def search_and_download(i, work, semaphore):
+            if work.cover_filepath == EMBEDDED_ALBUM_ART_SYMBOL:
+                cover_filepath = os.path.join(tmp_dir, f"{i:02}.{args.format.name.lower()}")
+                work.tmp_cover_filepath = cover_filepath
+            else:
+                cover_filepath = work.cover_filepath
+                os.makedirs(os.path.dirname(cover_filepath), exist_ok=True)
+
             try:
-                status = future.result()
+                async with semaphore:
+                    status = await sacad.search_and_download(
+                        work.metadata.album,
+                        work.metadata.artist,
+                        args.format,
+                        args.size,
+                        cover_filepath,
+                        size_tolerance_prct=args.size_tolerance_prct,
+                        source_classes=args.cover_sources,
+                        preserve_format=args.preserve_format,
+                        convert_progressive_jpeg=args.convert_progressive_jpeg,
+                    )
             except Exception as exception:
                 stats["errors"] += 1
                 logging.getLogger("sacad_r").error(
@@ -311,7 +408,10 @@ def get_covers(work, args):
                 if status:
                     if work.cover_filepath == EMBEDDED_ALBUM_ART_SYMBOL:
                         try:
-                            embed_album_art(work.tmp_cover_filepath, work.audio_filepaths)
+                            # tagging is blocking file I/O, run it in a thread to not stall the other searches
+                            await asyncio.get_running_loop().run_in_executor(
+                                None, embed_album_art, work.tmp_cover_filepath, work.audio_filepaths
+                            )
                         except Exception as exception:
                             stats["errors"] += 1
                             logging.getLogger("sacad_r").error(
@@ -328,51 +428,28 @@ def get_covers(work, args):
                     stats["no result found"] += 1
                     logging.getLogger("sacad_r").warning(f"Unable to find {work}")
 
-            progress.set_postfix(stats, refresh=False)
-            progress.update(1)
-
-        # post work
-        i = 0
-        # default event loop on Windows has a 512 fd limit,
-        # see https://docs.python.org/3/library/asyncio-eventloops.html#windows
-        # also on Linux default max open fd limit is 1024 (ulimit -n)
-        # so work in smaller chunks to avoid hitting fd limit
-        # this also updates the progress faster (instead of working on all searches, work on finishing the chunk before
-        # getting to the next one)
-        work_chunk_length = 4 if sys.platform.startswith("win") else 12
-        for work_chunk in ichunk(work, work_chunk_length):
-            futures = {}
-            for i, cur_work in enumerate(work_chunk, i):
-                if cur_work.cover_filepath == EMBEDDED_ALBUM_ART_SYMBOL:
-                    cover_filepath = os.path.join(tmp_dir, f"{i:02}.{args.format.name.lower()}")
-                    cur_work.tmp_cover_filepath = cover_filepath
-                else:
-                    cover_filepath = cur_work.cover_filepath
-                    os.makedirs(os.path.dirname(cover_filepath), exist_ok=True)
-                coroutine = sacad.search_and_download(
-                    cur_work.metadata.album,
-                    cur_work.metadata.artist,
-                    args.format,
-                    args.size,
-                    cover_filepath,
-                    size_tolerance_prct=args.size_tolerance_prct,
-                    source_classes=args.cover_sources,
-                    preserve_format=args.preserve_format,
-                    convert_progressive_jpeg=args.convert_progressive_jpeg,
-                )
-                future = asyncio.ensure_future(coroutine)
-                futures[future] = cur_work
+            nonlocal last_postfix_update
+            last_postfix_update = update_progress(progress, stats, last_postfix_update)
 
-            for future in futures:
-                future.add_done_callback(post_download)
+        async def search_and_download_all():
+            # default event loop on Windows has a 512 fd limit,
+            # see https://docs.python.org/3/library/asyncio-eventloops.html#windows
+            # also on Linux default max open fd limit is 1024 (ulimit -n)
+            # so limit the number of concurrent searches to avoid hitting fd limit
+            # a new search starts as soon as another one ends, so a slow search does not delay the following ones
+            semaphore = asyncio.Semaphore(4 if sys.platform.startswith("win") else 12)
+            await asyncio.gather(*(search_and_download(i, cur_work, semaphore) for i, cur_work in enumerate(work)))
 
-            # wait for end of work
-            root_future = asyncio.gather(*futures.keys())
-            asyncio.get_event_loop().run_until_complete(root_future)
+        last_postfix_update = 0
+        asyncio.run(search_and_download_all())
+        progress.set_postfix(stats, refresh=False)
 
 
 def cl_main():
     """Command line entry point."""
+    # needed for the library analysis worker processes of the frozen Windows executable
+    multiprocessing.freeze_support()
+
     # parse args
     arg_parser = argparse.ArgumentParser(
         description=f"SACAD (recursive tool) v{sacad.__version__}.{__doc__}",
@@ -14,7 +14,7 @@ import urllib.parse
 import appdirs
 import web_cache
 
-from sacad import http_helpers
+from sacad import http_helpers, mem_cache
 from sacad.cover import CoverSourceQuality  # noqa: F401
 
 MAX_THUMBNAIL_SIZE = 256
@@ -58,12 +58,16 @@ class CoverSource(metaclass=abc.ABCMeta):
                 expiration=random.randint(day_s * 7, day_s * 14),  # 1-2 weeks
                 compression=web_cache.Compression.DEFLATE,
             )
-            __class__.probe_cache = web_cache.WebCache(
-                db_filepath,
-                "cover_source_probe_data",
-                caching_strategy=web_cache.CachingStrategy.FIFO,
-                expiration=day_s * 30 * 6,
-            )  # 6 months
+            # keep recently probed URLs in memory, the same URLs are often probed several times in a run
+            __class__.probe_cache = mem_cache.LruMemoryCache(
+                web_cache.WebCache(
+                    db_filepath,
+                    "cover_source_probe_data",
+                    caching_strategy=web_cache.CachingStrategy.FIFO,
+                    expiration=day_s * 30 * 6,
+                ),  # 6 months
+                4096,
+            )
             logging.getLogger("Cache").debug(
                 f"Total size of file {db_filepath!r}: {__class__.api_cache.getDatabaseFileSize()}"
             )
@@ -83,7 +87,7 @@ class CoverSource(metaclass=abc.ABCMeta):
 
     async def search(self, album, artist):
         """Search for a given album/artist and return an iterable of CoverSourceResult."""
-        self.logger.debug(f"Searching with source {self.__class__.__name__!r}...")
+        self.logger.debug("Searching with source %r...", self.__class__.__name__)
         album = self.processAlbumString(album)
         artist = self.processArtistString(artist)
         url_data = self.getSearchUrl(album, artist)
@@ -146,10 +150,10 @@ class CoverSource(metaclass=abc.ABCMeta):
             f"Got {result_kept_count} relevant ({results_excluded_count + reference_only_count} excluded) results "
             f"from source {self.__class__.__name__!r}"
         )
-        for result in itertools.filterfalse(operator.attrgetter("is_only_reference"), results_kept):
-            self.logger.debug(
-                "%s %s%s %4dx%4d %s%s"
-                % (
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for result in itertools.filterfalse(operator.attrgetter("is_only_reference"), results_kept):
+                self.logger.debug(
+                    "%s %s%s %4dx%4d %s%s",
                     result.__class__.__name__,
                     ("(%02d) " % (result.rank)) if result.rank is not None else "",
                     result.format.name,
@@ -158,34 +162,27 @@ class CoverSource(metaclass=abc.ABCMeta):
                     result.urls[0],
                     " [x%u]" % (len(result.urls)) if len(result.urls) > 1 else "",
                 )
-            )
         return results_kept
 
     async def fetchResults(self, url, post_data=None):
         """Get a (store in cache callback, search results) tuple from an URL."""
         if post_data is not None:
-            self.logger.debug(f"Querying URL {url!r} {dict(post_data)}...")
+            self.logger.debug("Querying URL %r %s...", url, dict(post_data))
         else:
-            self.logger.debug(f"Querying URL {url!r}...")
+            self.logger.debug("Querying URL %r...", url)
         headers = {}
         self.updateHttpHeaders(headers)
         return await self.http.query(url, post_data=post_data, headers=headers, cache=__class__.api_cache)
 
     async def probeUrl(self, url, response_headers=None):
         """Probe URL reachability from cache or HEAD request."""
-        self.logger.debug(f"Probing URL {url!r}...")
+        self.logger.debug("Probing URL %r...", url)
         headers = {}
         self.updateHttpHeaders(headers)
-        resp_headers = {}
-        resp_ok = await self.http.isReachable(
-            url, headers=headers, response_headers=resp_headers, cache=__class__.probe_cache
+        return await self.http.isReachable(
+            url, headers=headers, response_headers=response_headers, cache=__class__.probe_cache
         )
 
-        if response_headers is not None:
-            response_headers.update(resp_headers)
-
-        return resp_ok
-
     @staticmethod
     def assembleUrl(base_url, params):
         """Build an URL from URL base and parameters."""
@@ -1,7 +1,9 @@
 """Itunes cover source."""
 
+import asyncio
 import collections
 import json
+import urllib.parse
 
 from sacad.cover import SUPPORTED_IMG_FORMATS as EXTENSION_FORMAT
 from sacad.cover import CoverImageFormat, CoverImageMetadata, CoverSourceQuality, CoverSourceResult
@@ -23,10 +25,17 @@ class ItunesCoverSource(CoverSource):
     """Itunes cover source."""
 
     SEARCH_URL = "https://itunes.apple.com/search"
+    MAX_CONCURRENT_PROBES = 4
 
     def __init__(self, *args, **kwargs):
         # https://stackoverflow.com/questions/12596300/itunes-search-api-rate-limit
-        super().__init__(*args, min_delay_between_accesses=3, **kwargs)
+        # only the search API is rate limited, not the image CDN
+        super().__init__(
+            *args,
+            min_delay_between_accesses=3,
+            rate_limited_domains=(urllib.parse.urlsplit(__class__.SEARCH_URL).netloc,),
+            **kwargs,
+        )
 
     def getSearchUrl(self, album, artist):
         """See CoverSource.getSearchUrl."""
@@ -40,33 +49,26 @@ class ItunesCoverSource(CoverSource):
         """See CoverSource.parseResults."""
         json_data = json.loads(api_data)
 
+        matching_results = [
+            (rank, result)
+            for rank, result in enumerate(json_data["results"], 1)
+            if (search_album == self.processAlbumString(result["collectionName"]))
+            and (search_artist == self.processArtistString(result["artistName"]))
+        ]
+
+        # probe image URLs of all results concurrently, with a bound to avoid hammering the server
+        probe_semaphore = asyncio.Semaphore(__class__.MAX_CONCURRENT_PROBES)
+        img_infos = await asyncio.gather(
+            *(self.probeResultImage(result, probe_semaphore) for _, result in matching_results)
+        )
+
         results = []
-        for rank, result in enumerate(json_data["results"], 1):
-            if (search_album != self.processAlbumString(result["collectionName"])) or (
-                search_artist != self.processArtistString(result["artistName"])
-            ):
-                continue
-            thumbnail_url = result["artworkUrl60"]
-            base_img_url = result["artworkUrl60"].rsplit("/", 1)[0]
-            url_found = False
-            for img_size in (5000, 1200, 600):
-                for img_format in (CoverImageFormat.PNG, CoverImageFormat.JPEG):
-                    suffix = "-100.jpg" if (img_format is CoverImageFormat.JPEG) else ".png"
-                    img_url = f"{base_img_url}/{img_size}x{img_size}{suffix}"
-                    if await self.probeUrl(img_url):
-                        url_found = True
-                        break
-                if url_found:
-                    break
-            else:
-                img_url = result["artworkUrl100"]
-                img_format = EXTENSION_FORMAT[img_url.rsplit(".", 1)[-1]]
-                img_size = 100
+        for (rank, result), (img_url, img_size, img_format) in zip(matching_results, img_infos):
             result = ItunesCoverSourceResult(
                 img_url,
                 (img_size, img_size),
                 img_format,
-                thumbnail_url=thumbnail_url,
+                thumbnail_url=result["artworkUrl60"],
                 source=self,
                 rank=rank,
                 check_metadata=CoverImageMetadata.NONE,
@@ -74,3 +76,16 @@ class ItunesCoverSource(CoverSource):
             results.append(result)
 
         return results
+
+    async def probeResultImage(self, result, probe_semaphore):
+        """Find the best available image for a result, and return a (URL, size, format) tuple."""
+        base_img_url = result["artworkUrl60"].rsplit("/", 1)[0]
+        async with probe_semaphore:
+            for img_size in (5000, 1200, 600):
+                for img_format in (CoverImageFormat.PNG, CoverImageFormat.JPEG):
+                    suffix = "-100.jpg" if (img_format is CoverImageFormat.JPEG) else ".png"
+                    img_url = f"{base_img_url}/{img_size}x{img_size}{suffix}"
+                    if await self.probeUrl(img_url):
+                        return img_url, img_size, img_format
+        img_url = result["artworkUrl100"]
+        return img_url, 100, EXTENSION_FORMAT[img_url.rsplit(".", 1)[-1]]
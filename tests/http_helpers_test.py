@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""Unit tests for HTTP helpers."""
+
+import unittest
+
+from sacad import http_helpers
+
+from . import sched_and_run
+
+
+class TestHttp(unittest.TestCase):
+    """Test suite for HTTP helpers."""
+
+    def test_shared_connector(self):
+        """Test the connector is shared by sessions of an event loop, and closed with the last one."""
+
+        async def coroutine():
+            http1 = http_helpers.Http()
+            http2 = http_helpers.Http()
+            http1._initSession()
+            http2._initSession()
+            connector = http1.session.connector
+            self.assertIs(http2.session.connector, connector)
+
+            await http1.close()
+            self.assertFalse(connector.closed)
+            await http1.close()
+            self.assertFalse(connector.closed)
+
+            http3 = http_helpers.Http()
+            http3._initSession()
+            self.assertIs(http3.session.connector, connector)
+            await http2.close()
+            self.assertFalse(connector.closed)
+            await http3.close()
+            self.assertTrue(connector.closed)
+
+            # a new connector is created for new sessions
+            http1._initSession()
+            self.assertIsNot(http1.session.connector, connector)
+            await http1.close()
+            self.assertIsNone(http1.session)
+
+        sched_and_run(coroutine())
+
+
+if __name__ == "__main__":
+    # run tests
+    unittest.main()
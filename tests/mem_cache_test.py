@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""Unit tests for in memory cache."""
+
+import unittest
+
+from sacad.mem_cache import LruMemoryCache
+
+
+class CountingDict(dict):
+    """Dict counting item reads."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.get_count = 0
+
+    def __getitem__(self, key):
+        self.get_count += 1
+        return super().__getitem__(key)
+
+
+class TestLruMemoryCache(unittest.TestCase):
+    """Test suite for in memory cache."""
+
+    def test_lru(self):
+        """Test items are served from memory, and least recently used ones are evicted."""
+        backing_cache = CountingDict(a=b"1", b=b"2", c=b"3")
+        cache = LruMemoryCache(backing_cache, 2)
+
+        self.assertEqual(cache["a"], b"1")
+        self.assertEqual(cache["a"], b"1")
+        self.assertEqual(backing_cache.get_count, 1)
+
+        cache["d"] = b"4"
+        self.assertEqual(backing_cache["d"], b"4")
+        backing_cache.get_count = 0
+        self.assertEqual(cache["d"], b"4")
+        self.assertEqual(backing_cache.get_count, 0)
+
+        # "a" is now the least recently used, and gets evicted
+        self.assertEqual(cache["b"], b"2")
+        self.assertEqual(cache["d"], b"4")
+        self.assertEqual(backing_cache.get_count, 1)
+        self.assertEqual(cache["a"], b"1")
+        self.assertEqual(backing_cache.get_count, 2)
+
+        self.assertIn("c", cache)
+        self.assertNotIn("e", cache)
+        with self.assertRaises(KeyError):
+            cache["e"]
+        self.assertEqual(len(cache), 4)
+
+    def test_max_bytes(self):
+        """Test the total size of items kept in memory is bounded."""
+        backing_cache = CountingDict(a=b"1" * 4, b=b"2" * 4, c=b"3" * 8, d=b"4" * 16)
+        cache = LruMemoryCache(backing_cache, 8, max_bytes=12)
+
+        self.assertEqual(cache["a"], b"1" * 4)
+        self.assertEqual(cache["b"], b"2" * 4)
+        self.assertEqual(backing_cache.get_count, 2)
+        self.assertEqual(cache["a"], b"1" * 4)
+        self.assertEqual(cache["b"], b"2" * 4)
+        self.assertEqual(backing_cache.get_count, 2)
+
+        # "a" is the least recently used, and gets evicted to make room for "c"
+        self.assertEqual(cache["c"], b"3" * 8)
+        self.assertEqual(backing_cache.get_count, 3)
+        self.assertEqual(cache["b"], b"2" * 4)
+        self.assertEqual(cache["c"], b"3" * 8)
+        self.assertEqual(backing_cache.get_count, 3)
+        self.assertEqual(cache["a"], b"1" * 4)
+        self.assertEqual(backing_cache.get_count, 4)
+
+        # "d" is bigger than the whole budget, it is never kept and does not evict anything
+        self.assertEqual(cache["d"], b"4" * 16)
+        self.assertEqual(cache["d"], b"4" * 16)
+        self.assertEqual(backing_cache.get_count, 6)
+        self.assertEqual(cache["a"], b"1" * 4)
+        self.assertEqual(cache["c"], b"3" * 8)
+        self.assertEqual(backing_cache.get_count, 6)
+
+        # replacing an item accounts for its new size
+        cache["a"] = b"5" * 2
+        self.assertEqual(cache.size, 10)
+
+
+if __name__ == "__main__":
+    # run tests
+    unittest.main()
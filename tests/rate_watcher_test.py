@@ -2,8 +2,10 @@
 
 """Unit tests for rate watcher."""
 
+import asyncio
 import os
 import tempfile
+import threading
 import time
 import unittest
 
@@ -73,6 +75,44 @@ class TestRateWatcher(unittest.TestCase):
             after = time.monotonic()
             self.assertAlmostEqual(after - before, 0, delta=ALMOST_NO_TIME)
 
+    def test_threads(self):
+        """Test rate limit with accesses from several threads."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_filepath = os.path.join(tmp_dir, "db.sqlite")
+            sched_and_run(
+                AccessRateWatcher(
+                    db_filepath, "http://1.domain.com/abcd", min_delay_between_accesses=1
+                ).waitAccessAsync()
+            )
+            time_first_access = time.monotonic()
+
+            errors = []
+            access_times = []
+
+            def access():
+                try:
+                    # each thread needs its own event loop
+                    asyncio.run(
+                        AccessRateWatcher(
+                            db_filepath, "http://1.domain.com/efgh", min_delay_between_accesses=1
+                        ).waitAccessAsync()
+                    )
+                except Exception as e:
+                    errors.append(e)
+                else:
+                    access_times.append(time.monotonic())
+
+            threads = [threading.Thread(target=access) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertFalse(errors)
+            access_times.sort()
+            self.assertAlmostEqual(access_times[0] - time_first_access, 1, delta=ALMOST_NO_TIME)
+            self.assertAlmostEqual(access_times[1] - time_first_access, 2, delta=ALMOST_NO_TIME)
+
 
 if __name__ == "__main__":
     # run tests
@@ -9,6 +9,7 @@ import os
 import shutil
 import tempfile
 import unittest
+import unittest.mock
 import urllib.parse
 
 import mutagen
@@ -186,6 +187,19 @@ class TestRecursive(unittest.TestCase):
                         self.assertEqual(work[idx].cover_filepath, os.path.join(__class__.album5_dir, "1.dat"))
                         self.assertEqual(work[idx].metadata, Metadata("ARTIST2", "ALBUM2", False))
 
+    def test_analyze_lib_processes(self):
+        """Test recursive directory analysis in worker processes."""
+        for full_scan in (False, True):
+            with self.subTest(full_scan=full_scan):
+                expected_work = recurse.analyze_lib(__class__.temp_dir.name, "a.jpg", full_scan=full_scan)
+                expected_work.sort(key=lambda x: (x.cover_filepath, x.metadata))
+                with unittest.mock.patch.object(recurse, "ANALYZE_SERIAL_MAX_DIR_COUNT", 0), unittest.mock.patch.object(
+                    recurse, "ANALYZE_MAX_PENDING_DIRS", 2
+                ), unittest.mock.patch("os.cpu_count", return_value=2):
+                    work = recurse.analyze_lib(__class__.temp_dir.name, "a.jpg", full_scan=full_scan)
+                work.sort(key=lambda x: (x.cover_filepath, x.metadata))
+                self.assertEqual(work, expected_work)
+
     def test_get_file_metadata(self):
         """Test file metadata extraction."""
         self.assertEqual(recurse.get_file_metadata(__class__.album1_filepath), Metadata("ARTIST1", "ALBUM1", False))